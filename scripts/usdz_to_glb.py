@@ -10,74 +10,159 @@ import sys
 import os
 import json
 import struct
-import tempfile
-import shutil
 import numpy as np
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; json.dumps is used instead
+    orjson = None
+
+
+def _fan_corners(face_counts):
+    """Return (T, 3) face-corner indices fan-triangulating arbitrary polygons."""
+    # Each n-gon emits n-2 triangles fanning out from its first corner
+    starts = np.cumsum(face_counts) - face_counts
+    tri_per_face = np.maximum(face_counts - 2, 0)
+    total_tris = int(tri_per_face.sum())
+    tri_starts = np.cumsum(tri_per_face) - tri_per_face
+
+    apex = np.repeat(starts, tri_per_face)
+    step = np.arange(total_tris) - np.repeat(tri_starts, tri_per_face) + 1
+    return np.stack([apex, apex + step, apex + step + 1], axis=1)
+
+
+def _tri_quad_corners(face_counts):
+    """Return (T, 3) face-corner indices for a mesh made only of triangles and quads."""
+    starts = np.cumsum(face_counts) - face_counts
+    is_quad = face_counts == 4
+    tri_per_face = is_quad + 1
+    tri_starts = np.cumsum(tri_per_face) - tri_per_face
+
+    corners = np.empty((int(tri_per_face.sum()), 3), dtype=np.int64)
+    corners[tri_starts] = np.stack([starts, starts + 1, starts + 2], axis=1)
+    quad_starts = starts[is_quad]
+    corners[tri_starts[is_quad] + 1] = np.stack([quad_starts, quad_starts + 2, quad_starts + 3], axis=1)
+    return corners
+
+
+def _triangle_list_counts(face_indices):
+    """Face counts for indices that form a plain triangle list (no faceVertexCounts)."""
+    return np.full(len(face_indices) // 3, 3, dtype=np.int32)
+
 
 def triangulate_mesh(points, face_counts, face_indices, normals=None):
-    """Convert polygon mesh to triangles."""
-    tri_indices = []
-    tri_normals = [] if normals is not None else None
-    
-    offset = 0
-    for count in face_counts:
-        if count == 3:
-            tri_indices.append([face_indices[offset], face_indices[offset+1], face_indices[offset+2]])
-            if normals is not None:
-                tri_normals.extend([normals[offset], normals[offset+1], normals[offset+2]])
-        elif count > 3:
-            # Fan triangulation
-            for i in range(1, count - 1):
-                tri_indices.append([face_indices[offset], face_indices[offset+i], face_indices[offset+i+1]])
-                if normals is not None:
-                    tri_normals.extend([normals[offset], normals[offset+i], normals[offset+i+1]])
-        offset += count
-    
+    """Convert polygon mesh to a flat uint32 triangle index array using fan triangulation.
+
+    Empty face_counts means face_indices is a plain triangle list.
+    """
+    face_indices = np.asarray(face_indices, dtype=np.uint32)
+    if face_counts is None or len(face_counts) == 0:
+        face_counts = _triangle_list_counts(face_indices)
+    face_counts = np.asarray(face_counts, dtype=np.int64)
+    if normals is not None:
+        normals = np.asarray(normals, dtype=np.float32).reshape(-1, 3)
+        if len(normals) != len(face_indices):
+            normals = None  # Only face-varying normals can be gathered per face corner
+
+    # Fast paths: USDZ assets are overwhelmingly triangles and quads
+    if len(face_counts) > 0 and face_counts.min() >= 3 and face_counts.max() == 3:
+        # Ignore any trailing indices/normals beyond the declared faces
+        corner_count = 3 * len(face_counts)
+        return face_indices[:corner_count], normals[:corner_count] if normals is not None else None
+
+    if len(face_counts) > 0 and face_counts.min() >= 3 and face_counts.max() == 4:
+        corners = _tri_quad_corners(face_counts)
+    else:
+        corners = _fan_corners(face_counts)
+
+    tri_indices = face_indices[corners].ravel()
+    tri_normals = normals[corners.ravel()] if normals is not None else None
+
     return tri_indices, tri_normals
 
 
-def build_glb(meshes_data):
-    """Build a minimal GLB binary from mesh data."""
-    # Collect all buffer data
-    accessors = []
-    buffer_views = []
-    mesh_primitives = []
-    nodes = []
-    all_bin = bytearray()
-    
+def _dedup_vertices(points, indices, normals=None):
+    """Merge byte-identical vertices (position plus normal, if any) and remap indices.
+
+    Surviving vertices keep the order of their first occurrence.
+    """
+    key = points if normals is None else np.concatenate([points, normals], axis=1)
+    key = np.ascontiguousarray(key)
+    rows = key.view(np.dtype((np.void, key.dtype.itemsize * key.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    if len(first) == len(points):
+        return points, indices, normals
+
+    order = np.argsort(first)
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+    keep = first[order]
+    indices = remap[inverse.ravel()][indices].astype(np.uint32, copy=False)
+    return points[keep], indices, normals[keep] if normals is not None else None
+
+
+def _align(length, alignment=4):
+    """Round a byte length up to the next multiple of alignment."""
+    return -(-length // alignment) * alignment
+
+
+def build_glb(meshes_data, fileobj):
+    """Write a minimal GLB built from mesh data to an open binary file.
+
+    Buffer sizes are known up front, so the BIN chunk is streamed array by
+    array rather than assembled in memory. Returns the number of bytes written.
+    """
+    # First pass: triangulate every mesh
+    prepared = []
     for mesh_info in meshes_data:
-        points = np.array(mesh_info["points"], dtype=np.float32)
+        points = np.asarray(mesh_info["points"], dtype=np.float32)
         face_counts = mesh_info.get("faceVertexCounts", [])
         face_indices = mesh_info.get("faceVertexIndices", [])
         normals_raw = mesh_info.get("normals")
         
         # Triangulate
-        if face_counts:
-            tri_indices, tri_normals = triangulate_mesh(
-                points, face_counts, face_indices,
-                normals_raw if normals_raw else None
+        indices, tri_normals = triangulate_mesh(
+            points, face_counts, face_indices,
+            normals_raw if normals_raw is not None and len(normals_raw) > 0 else None
+        )
+        # Out-of-range indices would wrap silently once packed as 16-bit
+        if len(indices) > 0 and indices.max() >= len(points):
+            raise ValueError(
+                f"Mesh {mesh_info.get('name', '')!r} references vertex {int(indices.max())} "
+                f"but has only {len(points)} points"
             )
-            indices = np.array(tri_indices, dtype=np.uint32).flatten()
-        else:
-            indices = np.array(face_indices, dtype=np.uint32)
-            tri_normals = normals_raw
         
-        # Position accessor
-        pos_offset = len(all_bin)
-        pos_data = points.tobytes()
-        all_bin.extend(pos_data)
-        # Pad to 4 bytes
-        while len(all_bin) % 4 != 0:
-            all_bin.append(0)
+        norm_arr = None
+        if tri_normals is not None and len(tri_normals) > 0:
+            norm_arr = np.asarray(tri_normals, dtype=np.float32).reshape(-1, 3)
+            # Per-face normals: expand to per-vertex if needed
+            if len(norm_arr) != len(points):
+                norm_arr = None  # Skip normals if count mismatch
+        
+        points, indices, norm_arr = _dedup_vertices(points, indices, norm_arr)
         
+        prepared.append((mesh_info, points, indices, norm_arr))
+    
+    # Second pass: record views/accessors, grouping buffers by attribute so
+    # all positions, then all indices, then all normals sit contiguously
+    accessors = []
+    buffer_views = []
+    mesh_primitives = []
+    nodes = []
+    position_views = []
+    index_views = []
+    normal_views = []
+    
+    for mesh_info, points, indices, norm_arr in prepared:
+        # Position accessor
+        pos_data = np.ascontiguousarray(points, dtype='<f4')
         pos_bv_idx = len(buffer_views)
         buffer_views.append({
             "buffer": 0,
-            "byteOffset": pos_offset,
-            "byteLength": len(pos_data),
+            "byteLength": pos_data.nbytes,
             "target": 34962  # ARRAY_BUFFER
         })
+        position_views.append((buffer_views[pos_bv_idx], pos_data))
         
         pos_min = points.min(axis=0).tolist()
         pos_max = points.max(axis=0).tolist()
@@ -91,25 +176,25 @@ def build_glb(meshes_data):
             "max": pos_max
         })
 
-        # Index accessor
-        idx_offset = len(all_bin)
-        idx_data = indices.astype(np.uint32).tobytes()
-        all_bin.extend(idx_data)
-        while len(all_bin) % 4 != 0:
-            all_bin.append(0)
-        
+        # Index accessor, packed as 16-bit when every index fits (all are below len(points))
+        if len(points) < 65536:
+            idx_data = np.ascontiguousarray(indices, dtype='<u2')
+            idx_comp_type = 5123  # UNSIGNED_SHORT
+        else:
+            idx_data = np.ascontiguousarray(indices, dtype='<u4')
+            idx_comp_type = 5125  # UNSIGNED_INT
         idx_bv_idx = len(buffer_views)
         buffer_views.append({
             "buffer": 0,
-            "byteOffset": idx_offset,
-            "byteLength": len(idx_data),
+            "byteLength": idx_data.nbytes,
             "target": 34963  # ELEMENT_ARRAY_BUFFER
         })
+        index_views.append((buffer_views[idx_bv_idx], idx_data))
         
         idx_acc_idx = len(accessors)
         accessors.append({
             "bufferView": idx_bv_idx,
-            "componentType": 5125,  # UNSIGNED_INT
+            "componentType": idx_comp_type,
             "count": len(indices),
             "type": "SCALAR"
         })
@@ -120,35 +205,23 @@ def build_glb(meshes_data):
         }
         
         # Normal accessor (optional)
-        if tri_normals and len(tri_normals) > 0:
-            norm_arr = np.array(tri_normals, dtype=np.float32)
-            if len(norm_arr.shape) == 1:
-                norm_arr = norm_arr.reshape(-1, 3)
-            # Per-face normals: expand to per-vertex if needed
-            if len(norm_arr) != len(points):
-                pass  # Skip normals if count mismatch
-            else:
-                norm_offset = len(all_bin)
-                norm_data = norm_arr.tobytes()
-                all_bin.extend(norm_data)
-                while len(all_bin) % 4 != 0:
-                    all_bin.append(0)
-                
-                norm_bv_idx = len(buffer_views)
-                buffer_views.append({
-                    "buffer": 0,
-                    "byteOffset": norm_offset,
-                    "byteLength": len(norm_data),
-                    "target": 34962
-                })
-                norm_acc_idx = len(accessors)
-                accessors.append({
-                    "bufferView": norm_bv_idx,
-                    "componentType": 5126,
-                    "count": len(norm_arr),
-                    "type": "VEC3"
-                })
-                primitive["attributes"]["NORMAL"] = norm_acc_idx
+        if norm_arr is not None:
+            norm_data = np.ascontiguousarray(norm_arr, dtype='<f4')
+            norm_bv_idx = len(buffer_views)
+            buffer_views.append({
+                "buffer": 0,
+                "byteLength": norm_data.nbytes,
+                "target": 34962
+            })
+            normal_views.append((buffer_views[norm_bv_idx], norm_data))
+            norm_acc_idx = len(accessors)
+            accessors.append({
+                "bufferView": norm_bv_idx,
+                "componentType": 5126,
+                "count": len(norm_arr),
+                "type": "VEC3"
+            })
+            primitive["attributes"]["NORMAL"] = norm_acc_idx
         
         mesh_idx = len(mesh_primitives)
         mesh_primitives.append({
@@ -160,6 +233,18 @@ def build_glb(meshes_data):
             "mesh": mesh_idx
         })
     
+    # Assign offsets: each view is aligned to its component size (so 16-bit
+    # index runs pack tightly) and padding only appears between groups
+    bin_arrays = []
+    cursor = 0
+    for group in (position_views, index_views, normal_views):
+        for buffer_view, arr in group:
+            cursor = _align(cursor, arr.itemsize)
+            buffer_view["byteOffset"] = cursor
+            bin_arrays.append((cursor, arr))
+            cursor += arr.nbytes
+    bin_length = _align(cursor)
+    
     # Build glTF JSON
     gltf = {
         "asset": {"version": "2.0", "generator": "usdz_to_glb.py"},
@@ -169,40 +254,46 @@ def build_glb(meshes_data):
         "meshes": mesh_primitives,
         "accessors": accessors,
         "bufferViews": buffer_views,
-        "buffers": [{"byteLength": len(all_bin)}]
+        "buffers": [{"byteLength": bin_length}]
     }
     
     # Encode JSON
-    json_str = json.dumps(gltf, separators=(',', ':'))
-    json_bytes = json_str.encode('utf-8')
+    if orjson is not None:
+        json_bytes = orjson.dumps(gltf)
+    else:
+        json_bytes = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
     # Pad JSON to 4-byte alignment
-    while len(json_bytes) % 4 != 0:
-        json_bytes += b' '
+    json_bytes += b' ' * ((-len(json_bytes)) & 3)
     
-    # Build GLB
+    # Write GLB
     # Header: magic(4) + version(4) + length(4)
     # Chunk 0 (JSON): length(4) + type(4) + data
     # Chunk 1 (BIN): length(4) + type(4) + data
-    bin_bytes = bytes(all_bin)
-    while len(bin_bytes) % 4 != 0:
-        bin_bytes += b'\x00'
-    
-    total_length = 12 + 8 + len(json_bytes) + 8 + len(bin_bytes)
+    total_length = 12 + 8 + len(json_bytes) + 8 + bin_length
     
-    glb = bytearray()
-    glb.extend(struct.pack('<I', 0x46546C67))  # magic: glTF
-    glb.extend(struct.pack('<I', 2))            # version
-    glb.extend(struct.pack('<I', total_length))
-    # JSON chunk
-    glb.extend(struct.pack('<I', len(json_bytes)))
-    glb.extend(struct.pack('<I', 0x4E4F534A))  # JSON
-    glb.extend(json_bytes)
-    # BIN chunk
-    glb.extend(struct.pack('<I', len(bin_bytes)))
-    glb.extend(struct.pack('<I', 0x004E4942))  # BIN
-    glb.extend(bin_bytes)
+    # magic "glTF", version 2, total length, then the JSON chunk header ("JSON")
+    fileobj.write(struct.pack('<5I', 0x46546C67, 2, total_length, len(json_bytes), 0x4E4F534A))
+    fileobj.write(json_bytes)
+    # BIN chunk header ("BIN\0")
+    fileobj.write(struct.pack('<2I', bin_length, 0x004E4942))
+    written = 0
+    for offset, arr in bin_arrays:
+        fileobj.write(b'\x00' * (offset - written))
+        fileobj.write(arr.data)
+        written = offset + arr.nbytes
+    fileobj.write(b'\x00' * (bin_length - written))
     
-    return bytes(glb)
+    return total_length
+
+
+def _vt_to_numpy(value, dtype, width=1):
+    """Wrap a USD Vt array as an ndarray, zero-copy through the buffer protocol when possible."""
+    try:
+        arr = np.asarray(memoryview(value))
+    except TypeError:  # Vt builds without buffer protocol support
+        arr = np.array(value)
+    arr = arr.astype(dtype, copy=False)
+    return arr.reshape(-1, width) if width > 1 else arr.reshape(-1)
 
 
 def convert_usdz_to_glb(input_path: str, output_path: str) -> dict:
@@ -219,35 +310,43 @@ def convert_usdz_to_glb(input_path: str, output_path: str) -> dict:
 
         meshes_data = []
         for prim in stage.Traverse():
-            if prim.IsA(UsdGeom.Mesh):
-                mesh = UsdGeom.Mesh(prim)
-                points_attr = mesh.GetPointsAttr()
-                points = points_attr.Get() if points_attr else None
-                face_counts_attr = mesh.GetFaceVertexCountsAttr()
-                face_counts = face_counts_attr.Get() if face_counts_attr else None
-                face_indices_attr = mesh.GetFaceVertexIndicesAttr()
-                face_indices = face_indices_attr.Get() if face_indices_attr else None
-                normals_attr = mesh.GetNormalsAttr()
-                normals = normals_attr.Get() if normals_attr else None
-
-                if points and face_indices:
-                    mesh_data = {
-                        "name": prim.GetName(),
-                        "points": [[float(p[0]), float(p[1]), float(p[2])] for p in points],
-                        "faceVertexCounts": [int(c) for c in face_counts] if face_counts else [],
-                        "faceVertexIndices": [int(i) for i in face_indices],
-                    }
-                    if normals:
-                        mesh_data["normals"] = [[float(n[0]), float(n[1]), float(n[2])] for n in normals]
-                    meshes_data.append(mesh_data)
+            if not prim.IsA(UsdGeom.Mesh):
+                continue
+
+            mesh = UsdGeom.Mesh(prim)
+            points = mesh.GetPointsAttr().Get()
+            face_indices = mesh.GetFaceVertexIndicesAttr().Get()
+            if not points or not face_indices:
+                continue
+            face_counts = mesh.GetFaceVertexCountsAttr().Get()
+            normals = mesh.GetNormalsAttr().Get()
+
+            # Keep USD's Vt arrays as NumPy arrays instead of nested Python lists
+            face_indices = _vt_to_numpy(face_indices, np.uint32)
+            if face_counts:
+                face_counts = _vt_to_numpy(face_counts, np.int32)
+            else:
+                # Without face counts, treat the indices as a plain triangle list
+                face_counts = _triangle_list_counts(face_indices)
+            if not np.any(face_counts >= 3):
+                # Only degenerate faces: no triangles, and loaders reject empty accessors
+                continue
+            mesh_data = {
+                "name": prim.GetName(),
+                "points": _vt_to_numpy(points, np.float32, 3),
+                "faceVertexCounts": face_counts,
+                "faceVertexIndices": face_indices,
+            }
+            if normals:
+                mesh_data["normals"] = _vt_to_numpy(normals, np.float32, 3)
+            meshes_data.append(mesh_data)
 
         if not meshes_data:
             return {"success": False, "error": "No mesh data found in USDZ file"}
 
-        # Build GLB and write directly to disk
-        glb_data = build_glb(meshes_data)
+        # Stream GLB directly to disk
         with open(output_path, 'wb') as f:
-            f.write(glb_data)
+            build_glb(meshes_data, f)
 
         total_verts = sum(len(m["points"]) for m in meshes_data)
         total_faces = sum(len(m.get("faceVertexCounts", [])) for m in meshes_data)
@@ -0,0 +1,255 @@
+"""
+Tests for scripts/usdz_to_glb.py triangulation and GLB assembly.
+
+Needs only numpy (USD is not required). Run with:
+    python3 -m unittest discover -s tests/scripts
+"""
+
+import io
+import json
+import os
+import struct
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts'))
+
+from usdz_to_glb import build_glb, triangulate_mesh  # noqa: E402
+
+COMPONENT_DTYPES = {5123: np.dtype('<u2'), 5125: np.dtype('<u4'), 5126: np.dtype('<f4')}
+TYPE_WIDTHS = {"SCALAR": 1, "VEC3": 3}
+
+
+def reference_triangles(face_counts, face_indices):
+    """Fan-triangulate face corners one face at a time (the original algorithm)."""
+    corners = []
+    offset = 0
+    for count in face_counts:
+        for i in range(1, count - 1):
+            corners.append([offset, offset + i, offset + i + 1])
+        offset += count
+    corners = np.array(corners, dtype=np.int64).reshape(-1, 3)
+    return np.asarray(face_indices)[corners], corners
+
+
+def decode_glb(data):
+    """Decode a GLB into its JSON and a function reading accessors from the BIN chunk."""
+    magic, version, total_length = struct.unpack_from('<3I', data, 0)
+    assert magic == 0x46546C67 and version == 2 and total_length == len(data)
+    json_length, json_type = struct.unpack_from('<2I', data, 12)
+    assert json_type == 0x4E4F534A and json_length % 4 == 0
+    gltf = json.loads(data[20:20 + json_length])
+    bin_length, bin_type = struct.unpack_from('<2I', data, 20 + json_length)
+    assert bin_type == 0x004E4942 and bin_length % 4 == 0
+    assert 28 + json_length + bin_length == len(data)
+    assert gltf["buffers"][0]["byteLength"] == bin_length
+    bin_chunk = data[28 + json_length:]
+
+    def read_accessor(index):
+        accessor = gltf["accessors"][index]
+        view = gltf["bufferViews"][accessor["bufferView"]]
+        dtype = COMPONENT_DTYPES[accessor["componentType"]]
+        width = TYPE_WIDTHS[accessor["type"]]
+        # glTF requires views to be aligned to their component size
+        assert view["byteOffset"] % dtype.itemsize == 0
+        assert view["byteLength"] == accessor["count"] * width * dtype.itemsize
+        assert view["byteOffset"] + view["byteLength"] <= bin_length
+        arr = np.frombuffer(bin_chunk, dtype, accessor["count"] * width, view["byteOffset"])
+        return arr.reshape(-1, width) if width > 1 else arr
+
+    return gltf, read_accessor
+
+
+def write_glb(meshes_data):
+    """Run build_glb into memory and return the decoded result."""
+    fileobj = io.BytesIO()
+    written = build_glb(meshes_data, fileobj)
+    data = fileobj.getvalue()
+    assert written == len(data)
+    return decode_glb(data)
+
+
+def primitive_triangles(gltf, read_accessor, mesh_index):
+    """Return the (T, 3, 3) triangle positions, normals (or None) and index component type."""
+    primitive = gltf["meshes"][mesh_index]["primitives"][0]
+    positions = read_accessor(primitive["attributes"]["POSITION"])
+    indices = read_accessor(primitive["indices"]).astype(np.int64)
+    assert len(indices) % 3 == 0
+    normals = None
+    if "NORMAL" in primitive["attributes"]:
+        normals = read_accessor(primitive["attributes"]["NORMAL"])[indices].reshape(-1, 3, 3)
+    component_type = gltf["accessors"][primitive["indices"]]["componentType"]
+    return positions[indices].reshape(-1, 3, 3), normals, component_type
+
+
+class TriangulateMeshTest(unittest.TestCase):
+    def assert_matches_reference(self, face_counts, face_indices):
+        rng = np.random.default_rng(len(face_indices))
+        normals = rng.random((len(face_indices), 3)).astype(np.float32)
+        expected, corners = reference_triangles(face_counts, face_indices)
+        tri_indices, tri_normals = triangulate_mesh(None, face_counts, face_indices, normals)
+        self.assertEqual(tri_indices.dtype, np.uint32)
+        self.assertEqual(tri_indices.ndim, 1)
+        np.testing.assert_array_equal(tri_indices.reshape(-1, 3), expected)
+        np.testing.assert_array_equal(tri_normals, normals[corners.ravel()])
+
+    def test_triangles(self):
+        self.assert_matches_reference([3, 3], [0, 1, 2, 2, 1, 3])
+
+    def test_triangles_and_quads(self):
+        self.assert_matches_reference([4, 3, 4], [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 0])
+
+    def test_ngons_and_degenerate_faces(self):
+        self.assert_matches_reference([5, 2, 3, 6], list(range(16)))
+
+    def test_ignores_indices_beyond_declared_faces(self):
+        tri_indices, tri_normals = triangulate_mesh(None, [3], [0, 1, 2, 3], np.zeros((4, 3)))
+        np.testing.assert_array_equal(tri_indices, [0, 1, 2])
+        self.assertEqual(len(tri_normals), 3)
+
+    def test_missing_face_counts_mean_triangle_list(self):
+        for face_counts in ([], None):
+            tri_indices, _ = triangulate_mesh(None, face_counts, [0, 1, 2, 2, 1, 3, 4])
+            self.assertEqual(tri_indices.dtype, np.uint32)
+            np.testing.assert_array_equal(tri_indices, [0, 1, 2, 2, 1, 3])
+
+    def test_drops_non_face_varying_normals_on_every_path(self):
+        # Vertex-interpolated normals: one per point, not one per face corner
+        vertex_normals = np.zeros((7, 3), dtype=np.float32)
+        for face_counts, face_indices in [([3, 3], [0, 1, 2, 2, 1, 3]),
+                                          ([4, 4], [0, 1, 2, 3, 1, 4, 5, 2]),
+                                          ([5], [0, 1, 2, 3, 4])]:
+            expected, _ = reference_triangles(face_counts, face_indices)
+            tri_indices, tri_normals = triangulate_mesh(None, face_counts, face_indices, vertex_normals)
+            np.testing.assert_array_equal(tri_indices.reshape(-1, 3), expected)
+            self.assertIsNone(tri_normals, face_counts)
+
+
+class BuildGlbTest(unittest.TestCase):
+    def test_triangle_positions_match_source(self):
+        rng = np.random.default_rng(0)
+        points = rng.random((12, 3)).astype(np.float32)
+        cases = [
+            ([3, 3, 3], rng.integers(0, 12, 9)),
+            ([4, 4, 3], rng.integers(0, 12, 11)),
+            ([5, 6, 2, 3], rng.integers(0, 12, 16)),
+        ]
+        meshes = [
+            {"name": f"m{i}", "points": points, "faceVertexCounts": counts, "faceVertexIndices": indices}
+            for i, (counts, indices) in enumerate(cases)
+        ]
+        gltf, read_accessor = write_glb(meshes)
+        self.assertEqual(len(gltf["meshes"]), len(cases))
+        for i, (counts, indices) in enumerate(cases):
+            expected, _ = reference_triangles(counts, indices)
+            triangles, normals, _ = primitive_triangles(gltf, read_accessor, i)
+            np.testing.assert_array_equal(triangles, points[expected])
+            self.assertIsNone(normals)
+
+    def test_face_varying_normals(self):
+        # Triangle soup: one vertex and one normal per face corner
+        rng = np.random.default_rng(1)
+        points = rng.random((6, 3)).astype(np.float32)
+        normals = rng.random((6, 3)).astype(np.float32)
+        meshes = [{
+            "name": "soup",
+            "points": points,
+            "faceVertexCounts": [3, 3],
+            "faceVertexIndices": np.arange(6),
+            "normals": normals,
+        }]
+        gltf, read_accessor = write_glb(meshes)
+        triangles, tri_normals, _ = primitive_triangles(gltf, read_accessor, 0)
+        np.testing.assert_array_equal(triangles, points.reshape(-1, 3, 3))
+        np.testing.assert_array_equal(tri_normals, normals.reshape(-1, 3, 3))
+
+    def test_mesh_without_face_counts_is_a_triangle_list(self):
+        points = np.eye(3, dtype=np.float32)
+        gltf, read_accessor = write_glb([{"name": "list", "points": points, "faceVertexIndices": [0, 1, 2]}])
+        triangles, _, _ = primitive_triangles(gltf, read_accessor, 0)
+        np.testing.assert_array_equal(triangles, points.reshape(1, 3, 3))
+
+    def test_vertex_normal_quad_mesh_converts_without_normals(self):
+        points = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [2, 0, 0], [2, 1, 0]],
+                          dtype=np.float32)
+        counts = [4, 4]
+        indices = [0, 1, 2, 3, 1, 4, 5, 2]
+        gltf, read_accessor = write_glb([{
+            "name": "quads",
+            "points": points,
+            "faceVertexCounts": counts,
+            "faceVertexIndices": indices,
+            "normals": np.tile([0, 0, 1], (len(points), 1)),
+        }])
+        expected, _ = reference_triangles([3, 3, 3, 3], [0, 1, 2, 0, 2, 3, 1, 4, 5, 1, 5, 2])
+        triangles, normals, _ = primitive_triangles(gltf, read_accessor, 0)
+        np.testing.assert_array_equal(triangles, points[expected])
+        self.assertIsNone(normals)
+
+    def test_index_width_cutoff(self):
+        # Unique vertices so deduplication cannot lower the vertex count
+        def mesh(name, vertex_count):
+            points = np.arange(vertex_count * 3, dtype=np.float32).reshape(-1, 3)
+            return {"name": name, "points": points,
+                    "faceVertexCounts": [3], "faceVertexIndices": [0, 1, vertex_count - 1]}
+
+        meshes = [mesh("max16", 65535), mesh("min32", 65536)]
+        gltf, read_accessor = write_glb(meshes)
+        for i, (source, expected_type) in enumerate(zip(meshes, [5123, 5125])):
+            triangles, _, component_type = primitive_triangles(gltf, read_accessor, i)
+            self.assertEqual(component_type, expected_type, source["name"])
+            np.testing.assert_array_equal(
+                triangles, source["points"][source["faceVertexIndices"]].reshape(-1, 3, 3))
+
+    def test_views_are_aligned_to_component_size(self):
+        # Odd-length 16-bit index runs between 32-bit ones would misalign the latter
+        def mesh(name, vertex_count, face_count):
+            points = np.arange(vertex_count * 3, dtype=np.float32).reshape(-1, 3)
+            indices = np.arange(face_count * 3) % vertex_count
+            return {"name": name, "points": points,
+                    "faceVertexCounts": [3] * face_count, "faceVertexIndices": indices}
+
+        meshes = [mesh("small", 5, 1), mesh("big", 65536, 1), mesh("small2", 7, 3), mesh("big2", 65536, 2)]
+        gltf, read_accessor = write_glb(meshes)
+        component_types = []
+        for i, source in enumerate(meshes):
+            # read_accessor asserts each view's byteOffset is a multiple of its component size
+            triangles, _, component_type = primitive_triangles(gltf, read_accessor, i)
+            component_types.append(component_type)
+            np.testing.assert_array_equal(
+                triangles, source["points"][source["faceVertexIndices"]].reshape(-1, 3, 3))
+        self.assertEqual(component_types, [5123, 5125, 5123, 5125])
+        # Views are grouped: all positions, then all indices, then all normals
+        offsets = [view["byteOffset"] for view in gltf["bufferViews"]]
+        position_offsets = offsets[0::2]
+        index_offsets = offsets[1::2]
+        self.assertLess(max(position_offsets), min(index_offsets))
+
+    def test_rejects_out_of_range_indices(self):
+        points = np.eye(4, 3, dtype=np.float32)
+        for indices in ([0, 1, 65537], [0, 1, 4]):
+            with self.assertRaises(ValueError):
+                write_glb([{"name": "bad", "points": points,
+                            "faceVertexCounts": [3], "faceVertexIndices": indices}])
+
+    def test_duplicate_vertices_are_merged(self):
+        base = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]], dtype=np.float32)
+        points = np.concatenate([base, base])
+        counts = [3, 3]
+        indices = [0, 1, 2, 5, 7, 6]
+        gltf, read_accessor = write_glb([
+            {"name": "dup", "points": points, "faceVertexCounts": counts, "faceVertexIndices": indices}
+        ])
+        primitive = gltf["meshes"][0]["primitives"][0]
+        self.assertEqual(gltf["accessors"][primitive["attributes"]["POSITION"]]["count"], 4)
+        expected, _ = reference_triangles(counts, indices)
+        triangles, _, _ = primitive_triangles(gltf, read_accessor, 0)
+        np.testing.assert_array_equal(triangles, points[expected])
+        # Surviving vertices keep their first-occurrence order
+        np.testing.assert_array_equal(read_accessor(primitive["attributes"]["POSITION"]), base)
+
+
+if __name__ == '__main__':
+    unittest.main()